@@ -0,0 +1,122 @@
+from itertools import chain
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _score_postings_numpy(indptr, doc_ids, weights, query_term_ids, num_docs):
+    scores = np.zeros(num_docs, dtype=np.float32)
+    for term_id in query_term_ids:
+        start, end = indptr[term_id], indptr[term_id + 1]
+        # A document appears at most once in the postings of a term so the fancy index add is safe
+        scores[doc_ids[start:end]] += weights[start:end]
+    return scores
+
+
+def _score_postings_loop(indptr, doc_ids, weights, query_term_ids, num_docs):
+    scores = np.zeros(num_docs, dtype=np.float32)
+    for i in range(len(query_term_ids)):
+        term_id = query_term_ids[i]
+        start, end = indptr[term_id], indptr[term_id + 1]
+        for j in range(start, end):
+            scores[doc_ids[j]] += weights[j]
+    return scores
+
+
+# The loop is compiled without parallel=True. It is faster on a single thread since it only reads the postings of a few
+# terms, and the numba tbb thread pool hangs the process on exit after the package forks worker processes
+_score_postings = njit(cache=True)(_score_postings_loop) if njit else _score_postings_numpy
+
+
+def flatten_tokens(corpus: List[List[str]]) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+    """
+    Convert a list of token lists to a flat array of token ids
+    :param corpus: the tokens of each document
+    :return: the vocab of token -> token id, the token ids of all the documents, and the offsets of each document
+             so that the token ids of document i are in token_ids[offsets[i]:offsets[i + 1]]
+    """
+    offsets = np.zeros(len(corpus) + 1, dtype=np.int64)
+    np.cumsum([len(document) for document in corpus], out=offsets[1:])
+    tokens = np.empty(offsets[-1], dtype=object)
+    tokens[:] = list(chain.from_iterable(corpus))
+    # factorize numbers the tokens in the order they first appear
+    token_ids, vocab_tokens = pd.factorize(tokens)
+    vocab = dict(zip(vocab_tokens.tolist(), range(len(vocab_tokens))))
+    return vocab, token_ids.astype(np.int32), offsets
+
+
+def unflatten_tokens(vocab: Dict[str, int], token_ids: np.ndarray, offsets: np.ndarray) -> List[List[str]]:
+    """
+    Convert flattened token ids back to a list of token lists. The lists share one string object for each token
+    :return: the tokens of each document
+    """
+    tokens = np.array(list(vocab), dtype=object)
+    return [tokens[token_ids[start:end]].tolist() for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+class SparseBM25:
+    '''
+    A BM25 Okapi index stored as term postings in CSR form.
+
+    Gives the same scores as rank_bm25.BM25Okapi, but the term weights are computed once when the index is built,
+    so a search only adds up the postings of the search terms. The scoring is compiled with numba if it is installed.
+    '''
+
+    def __init__(self, corpus: List[List[str]], k1=1.5, b=0.75, epsilon=0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self._index(*flatten_tokens(corpus))
+
+    @classmethod
+    def from_flat(cls, vocab: Dict[str, int], token_ids: np.ndarray, offsets: np.ndarray, k1=1.5, b=0.75,
+                  epsilon=0.25):
+        """
+        Create the index from tokens flattened by flatten_tokens
+        """
+        bm25 = cls.__new__(cls)
+        bm25.k1 = k1
+        bm25.b = b
+        bm25.epsilon = epsilon
+        bm25._index(vocab, token_ids, offsets)
+        return bm25
+
+    def _index(self, vocab, token_ids, offsets):
+        self.vocab = vocab
+        self.corpus_size = len(offsets) - 1
+        self.doc_len = np.diff(offsets).astype(np.int32)
+        self.avgdl = self.doc_len.mean() if self.corpus_size else 0.0
+
+        # Count each (term, doc) pair. np.unique sorts the pairs by term then doc, which is the CSR layout:
+        # the postings of term t are in indptr[t]:indptr[t + 1]
+        num_docs = max(self.corpus_size, 1)
+        token_docs = np.repeat(np.arange(self.corpus_size, dtype=np.int64), self.doc_len)
+        postings, term_freqs = np.unique(token_ids.astype(np.int64) * num_docs + token_docs, return_counts=True)
+        term_ids = (postings // num_docs).astype(np.int32)
+        self.doc_ids = (postings % num_docs).astype(np.int32)
+        term_freqs = term_freqs.astype(np.float32)
+        doc_counts = np.bincount(term_ids, minlength=len(self.vocab))
+        self.indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_counts, out=self.indptr[1:])
+
+        # Same idf as BM25Okapi, with negative idfs floored to epsilon * average idf
+        idf = np.log(self.corpus_size - doc_counts + 0.5) - np.log(doc_counts + 0.5)
+        self.average_idf = idf.mean() if len(idf) else 0.0
+        idf[idf < 0] = self.epsilon * self.average_idf
+        self.idf = idf.astype(np.float32)
+
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[self.doc_ids] / self.avgdl)
+        self.weights = (self.idf[term_ids] * term_freqs * (self.k1 + 1) / (term_freqs + norm)).astype(np.float32)
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        query_term_ids = np.array([self.vocab[term] for term in query if term in self.vocab], dtype=np.int32)
+        return _score_postings(self.indptr, self.doc_ids, self.weights, query_term_ids, self.corpus_size)
+
+    def __len__(self):
+        return self.corpus_size
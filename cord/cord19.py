@@ -1,3 +1,5 @@
+import copy
+import hashlib
 import pickle
 import re
 import time
@@ -8,15 +10,15 @@ import numpy as np
 import pandas as pd
 import requests
 from IPython.display import display, clear_output
-from rank_bm25 import BM25Okapi
 from requests import HTTPError
 
-from cord.core import render_html, show_common, describe_dataframe, is_kaggle, CORD_CHALLENGE_PATH, \
-    find_data_dir, SARS_DATE, SARS_COV_2_DATE, listify
+from cord.bm25 import SparseBM25, flatten_tokens, unflatten_tokens
+from cord.core import render_html, describe_dataframe, is_kaggle, CORD_CHALLENGE_PATH, \
+    find_data_dir, SARS_DATE, SARS_COV_2_DATE, listify, cord_cache_dir
 from cord.dates import add_date_diff
 from cord.jsonpaper import load_json_paper, PDF_JSON, PMC_JSON, \
     get_json_paths
-from cord.text import preprocess, shorten, summarize
+from cord.text import preprocess, preprocess_parallel, shorten, summarize
 from cord.vectors import show_2d_chart, similar_papers
 
 _MINIMUM_SEARCH_SCORE = 2
@@ -35,14 +37,15 @@ def get(url, timeout=6):
 
 _DISPLAY_COLS = ['sha', 'title', 'abstract', 'publish_time', 'authors', 'has_text']
 _RESEARCH_PAPERS_SAVE_FILE = 'ResearchPapers.pickle'
+# The index tokens file written by earlier versions of save
+_RESEARCH_PAPERS_TOKENS_FILE = 'ResearchPapersTokens.pq'
+# Part of the BM25 index cache file name. Bump it when the cached index format changes so old caches are not loaded
+_INDEX_CACHE_VERSION = 4
+_CATEGORY_COLS = ['license', 'source', 'journal', 'full_text_file']
 _COVID = ['sars-cov-2', '2019-ncov', 'covid-19', 'covid-2019', 'wuhan', 'hubei', 'coronavirus']
 
 
-# Convert the doi to a url
-def doi_url(d):
-    if not d:
-        return '#'
-    return f'http://{d}' if d.startswith('doi.org') else f'http://doi.org/{d}'
+_AUTHOR_PUNCTUATION = str.maketrans('', '', "'[]")
 
 
 _abstract_terms_ = '(Publisher|Abstract|Summary|BACKGROUND|INTRODUCTION)'
@@ -53,42 +56,17 @@ _relevant_re_ = '.*vir.*|.*sars.*|.*mers.*|.*corona.*|.*ncov.*|.*immun.*|.*nosoc
 _relevant_re_ = _relevant_re_ + '.*epidem.*|.*emerg.*|.*vacc.*|.*cytokine.*'
 
 
+_ABSTRACT_TERMS_PATTERN = re.compile(_abstract_terms_)
+
+
 def remove_common_terms(abstract):
-    return re.sub(_abstract_terms_, '', abstract)
+    return _ABSTRACT_TERMS_PATTERN.sub('', abstract)
 
 
 def start(data):
     return data.copy()
 
 
-def clean_title(data):
-    # Set junk titles to NAN
-    title_relevant = data.title.fillna('').str.match(_relevant_re_, case=False)
-    title_short = data.title.fillna('').apply(len) < 30
-    title_junk = title_short & ~title_relevant
-    data.loc[title_junk, 'title'] = ''
-    return data
-
-
-def clean_abstract(data):
-    # Set unknowns to NAN
-    abstract_unknown = data.abstract == 'Unknown'
-    data.loc[abstract_unknown, 'abstract'] = np.nan
-
-    # Fill missing abstract with the title
-    data.abstract = data.abstract.fillna(data.title)
-
-    # Remove common terms like publisher
-    data.abstract = data.abstract.fillna('').apply(remove_common_terms)
-
-    # Remove the abstract if it is too common
-    common_abstracts = show_common(data, 'abstract').query('abstract > 2') \
-        .reset_index().query('~(index =="")')['index'].tolist()
-    data.loc[data.abstract.isin(common_abstracts), 'abstract'] = ''
-
-    return data
-
-
 def drop_missing(data):
     missing = (data.published.isnull()) & \
               (data.sha.isnull()) & \
@@ -97,69 +75,83 @@ def drop_missing(data):
     return data[~missing].reset_index(drop=True)
 
 
-def fill_nulls(data):
-    data.authors = data.authors.fillna('')
-    data.doi = data.doi.fillna('')
-    data.journal = data.journal.fillna('')
-    data.abstract = data.abstract.fillna('')
-    return data
-
-
 def rename_publish_time(data):
     return data.rename(columns={'publish_time': 'published'})
 
 
 COVID_TERMS = ['covid', 'sars-?n?cov-?2', '2019-ncov', 'novel coronavirus', 'sars coronavirus 2']
-COVID_SEARCH = f".*({'|'.join(COVID_TERMS)})"
-NOVEL_CORONAVIRUS = '.*novel coronavirus'
-WUHAN_OUTBREAK = 'wuhan'
 
 
-def tag_covid(data):
+# The pattern searched in the first line of the abstract for each tag
+_TAG_PATTERNS = {'covid': '|'.join(COVID_TERMS),
+                 'wuhan': 'wuhan|hubei',
+                 'virus': 'virus|viral',
+                 'coronavirus': 'corona',
+                 'sars': 'sars'}
+
+
+def find_tags(abstracts):
     """
-    Tag all the records that match covid
-    :param data:
-    :return: data
+    Search the first line of each abstract for the tag terms
+    :param abstracts: a series of abstracts
+    :return: a dataframe with a boolean column for each of the _TAG_PATTERNS
     """
-    abstract = data.abstract.fillna('')
-    since_covid = (data.published > SARS_COV_2_DATE) | (data.published.isnull())
-    covid_term_match = since_covid & abstract.str.match(COVID_SEARCH, case=False)
-    wuhan_outbreak = since_covid & abstract.str.match('.*(wuhan|hubei)', case=False)
-    covid_match = covid_term_match | wuhan_outbreak
-    data['covid_related'] = False
-    data.loc[covid_match, 'covid_related'] = True
-    return data
+    # Only the first line is searched, as the tags were matched with str.match('.*term') where . stops at a newline
+    first_lines = abstracts.fillna('').str.replace('(?s)\n.*', '', regex=True)
+    try:
+        # The regex searches are vectorized on arrow strings
+        first_lines = first_lines.astype('string[pyarrow]')
+    except (ImportError, TypeError):
+        pass
+    # Lowercasing once is faster than a case insensitive search for each tag
+    first_lines = first_lines.str.lower()
+    return pd.DataFrame({tag: first_lines.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+                         for tag, pattern in _TAG_PATTERNS.items()}, index=abstracts.index)
 
 
-def tag_virus(data):
-    VIRUS_SEARCH = f".*(virus|viruses|viral)"
-    viral_cond = data.abstract.str.match(VIRUS_SEARCH, case=False)
-    data['virus'] = False
-    data.loc[viral_cond, 'virus'] = True
+def clean_title(data):
+    # Set junk titles to blank. Some titles are short but seem relevant so keep those
+    titles = data.title.fillna('')
+    title_relevant = titles.str.lower().str.match(_relevant_re_)
+    title_junk = (titles.str.len() < 30) & ~title_relevant
+    data['title'] = titles.where(~title_junk, '')
     return data
 
 
-def tag_coronavirus(data):
-    corona_cond = data.abstract.str.match(".*corona", case=False)
-    data['coronavirus'] = False
-    data.loc[corona_cond, 'coronavirus'] = True
+def clean_abstract(data):
+    # Fill unknown or missing abstracts with the title
+    abstracts = data.abstract.where(data.abstract != 'Unknown').fillna(data.title)
+
+    # Remove common terms like publisher
+    abstracts = abstracts.fillna('').str.replace(_abstract_terms_, '', regex=True)
+
+    # Remove the abstract if it is too common
+    abstract_counts = abstracts.value_counts().head(20)
+    common_abstracts = set(abstract_counts[abstract_counts > 2].index) - {''}
+    data['abstract'] = abstracts.where(~abstracts.isin(common_abstracts), '')
     return data
 
 
-def tag_sars(data):
-    sars_cond = data.abstract.str.match(".*sars", case=False)
-    sars_not_covid = ~(data.covid_related) & (sars_cond)
-    data['sars'] = False
-    data.loc[sars_not_covid, 'sars'] = True
+def fill_nulls(data):
+    data.authors = data.authors.fillna('')
+    data.doi = data.doi.fillna('')
+    data.journal = data.journal.fillna('')
     return data
 
 
 def apply_tags(data):
+    """
+    Tag the records that are covid related, or mention viruses, coronaviruses or sars
+    :param data:
+    :return: data
+    """
     print('Applying tags to metadata')
-    data = data.pipe(tag_covid) \
-        .pipe(tag_virus) \
-        .pipe(tag_coronavirus) \
-        .pipe(tag_sars)
+    tags = find_tags(data.abstract)
+    since_covid = ((data.published > SARS_COV_2_DATE) | (data.published.isnull())).values
+    data['covid_related'] = since_covid & (tags.covid | tags.wuhan).values
+    data['virus'] = tags.virus.values
+    data['coronavirus'] = tags.coronavirus.values
+    data['sars'] = tags.sars.values & ~data.covid_related.values
     return data
 
 
@@ -198,11 +190,76 @@ def get_pmcid_json_path(data_path, full_text_file, pmcid):
         return Path(data_path) / full_text_file / full_text_file / PMC_JSON / f'{pmcid}.xml.json'
 
 
-def _get_bm25Okapi(index_tokens):
+def _get_bm25_index(index_tokens):
     has_tokens = index_tokens.apply(len).sum() > 0
     if not has_tokens:
         index_tokens.loc[0] = ['no', 'tokens']
-    return BM25Okapi(index_tokens.tolist())
+    return SparseBM25(index_tokens.tolist())
+
+
+def _get_index_cache_path(metadata, data_path, index):
+    """
+    :return: the path of the cached BM25 index, keyed by the cache version, a hash of the metadata shas and abstracts
+             and, for the text index, the names and modification times of the json cache files
+    """
+    key = hashlib.sha256(pd.util.hash_pandas_object(metadata[['sha', 'abstract']]).values.tobytes())
+    if index == 'text':
+        from cord.jsonpaper import get_json_cache_dir
+        for json_cache_path in sorted(get_json_cache_dir().glob('jsoncache_*')):
+            key.update(f'{json_cache_path.name}:{json_cache_path.stat().st_mtime_ns}'.encode())
+    return cord_cache_dir(data_path) / f'bm25_{index}_v{_INDEX_CACHE_VERSION}_{key.hexdigest()}.pkl'
+
+
+def _load_index_cache(cache_path, num_papers):
+    """
+    :return: the flattened index tokens (vocab, token_ids, offsets) and the BM25 index,
+             or None if the cache file cannot be read or does not hold an index for the papers
+    """
+    print('Loading the BM25 index from', cache_path.name)
+    try:
+        with cache_path.open('rb') as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, AttributeError, EOFError, ImportError) as e:
+        print('Could not load the BM25 index from', cache_path.name, e)
+        return None
+    if not isinstance(cached, tuple) or len(cached) != 2:
+        return None
+    flat_tokens, bm25_index = cached
+    if not isinstance(flat_tokens, tuple) or len(flat_tokens) != 3 or not isinstance(bm25_index, SparseBM25) \
+            or len(flat_tokens[2]) - 1 != num_papers:
+        return None
+    return flat_tokens, bm25_index
+
+
+def _save_index_cache(cache_path, index, flat_tokens, bm25_index):
+    """
+    Save the BM25 index and remove the index caches of earlier metadata, json caches or cache versions
+    """
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with cache_path.open('wb') as f:
+            pickle.dump((flat_tokens, bm25_index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        for old_cache_path in cache_path.parent.glob(f'bm25_{index}_*.pkl'):
+            if old_cache_path != cache_path:
+                old_cache_path.unlink()
+    except OSError as e:
+        print('Could not save the BM25 index to', cache_path, e)
+
+
+def _get_antivirals(vocab, token_ids, offsets, index=None):
+    """
+    Find the antiviral tokens, the tokens ending in "vir", from the flattened index tokens
+    :return: a series with the comma separated antiviral tokens of each paper
+    """
+    tokens = np.array(list(vocab), dtype=object)
+    is_antiviral = np.array([token.endswith('vir') for token in tokens], dtype=bool)
+    positions = np.flatnonzero(is_antiviral[token_ids])
+    docs = np.searchsorted(offsets, positions, side='right') - 1
+    antivirals = pd.Series(tokens[token_ids[positions]], dtype=object).groupby(docs).agg(','.join)
+    antivirals = antivirals.reindex(range(len(offsets) - 1), fill_value='')
+    if index is not None:
+        antivirals.index = index
+    return antivirals
 
 
 def _set_index_from_text(metadata, data_path):
@@ -211,27 +268,28 @@ def _set_index_from_text(metadata, data_path):
     print('Creating the BM25 index from the text contents of the papers')
     json_cache_dir = get_json_cache_dir()
     file_paths = [PurePath(p) for p in json_cache_dir.glob(f'jsoncache_*.pq')]
+    token_lookup = {}
     for cache_path in file_paths:
         print('Loading json cache file', cache_path.stem)
         json_cache = pd.read_parquet(cache_path)
         part_no = cache_path.stem[len('jsoncache_'):]
         dictionary_path = json_cache_dir / f'jsoncache_{part_no}.dict'
         dictionary = Dictionary.load((str(dictionary_path.resolve())))
-        json_cache['index_tokens'] \
-            = json_cache.token_int.apply(lambda token_int: [dictionary[ti] for ti in token_int])
+        id2token = np.array([dictionary[ti] for ti in range(len(dictionary))], dtype=object)
+        json_cache['index_tokens'] = json_cache.token_int.apply(lambda token_int: id2token[token_int].tolist())
         json_tokens = json_cache.drop(columns=['token_int']).set_index('cord_uid')
-        token_lookup = json_tokens.to_dict()['index_tokens']
-        if 'index_tokens' not in metadata:
-            metadata['index_tokens'] = metadata['cord_uid'].apply(lambda c: token_lookup.get(c, np.nan))
-        else:
-            need_tokens = metadata.index_tokens.isnull()
-            metadata.loc[need_tokens, 'index_tokens'] = \
-                metadata.loc[need_tokens, 'cord_uid'].apply(lambda c: token_lookup.get(c, np.nan))
+        # Papers found in an earlier cache file keep the tokens from that file
+        token_lookup = {**json_tokens.to_dict()['index_tokens'], **token_lookup}
+
+    # Set the tokens of all the papers at once instead of once per cache file
+    metadata['index_tokens'] = metadata['cord_uid'].map(token_lookup)
 
     # If the index tokens are still null .. use the abstracts
     null_tokens = metadata.index_tokens.isnull()
     print('There are', null_tokens.sum(), 'papers that will be indexed using the abstract instead of the contents')
-    metadata.loc[null_tokens, 'index_tokens'] = metadata.loc[null_tokens].abstract.apply(preprocess)
+    null_abstracts = metadata.loc[null_tokens].abstract
+    abstract_tokens = preprocess_parallel(null_abstracts.fillna('').tolist())
+    metadata.loc[null_tokens, 'index_tokens'] = pd.Series(abstract_tokens, index=null_abstracts.index)
     missing_index_tokens = len(metadata.loc[metadata.index_tokens.isnull()])
     if missing_index_tokens > 0:
         print('There still are', missing_index_tokens, 'index tokens')
@@ -239,6 +297,27 @@ def _set_index_from_text(metadata, data_path):
     return metadata
 
 
+def _get_lz4_open():
+    """
+    :return: lz4.frame.open, or None if lz4 is not installed
+    """
+    try:
+        import lz4.frame
+        return lz4.frame.open
+    except ImportError:
+        return None
+
+
+_REGEX_SPECIAL_CHARS = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+def _is_literal(search_str):
+    """
+    :return: True if the search string has no regex special characters, so it can be matched as plain text
+    """
+    return not _REGEX_SPECIAL_CHARS.search(search_str)
+
+
 def create_annoy_index(document_vectors):
     print('Creating Annoy document index')
     tick = time.time()
@@ -254,17 +333,23 @@ def create_annoy_index(document_vectors):
 
 class ResearchPapers:
 
-    def __init__(self, metadata: pd.DataFrame, bm25_index: BM25Okapi = None, data_dir='data', index='abstract',
+    def __init__(self, metadata: pd.DataFrame, bm25_index: SparseBM25 = None, data_dir='data', index='abstract',
                  view='html'):
         self.data_path = Path(data_dir)
         self.num_results = 10
         self.view = view
         self.metadata = metadata
 
-        if bm25_index is None:
-            if 'index_tokens' not in metadata:
+        if bm25_index is None and 'index_tokens' not in metadata:
+            index_from_text = any([index == t for t in ['text', 'texts', 'content', 'contents']])
+            cache_index = 'text' if index_from_text else 'abstract'
+            cache_path = _get_index_cache_path(metadata, data_dir, cache_index)
+            cached_index = _load_index_cache(cache_path, len(metadata)) if cache_path.exists() else None
+            if cached_index:
+                flat_tokens, bm25_index = cached_index
+            else:
                 print('\nIndexing research papers')
-                if any([index == t for t in ['text', 'texts', 'content', 'contents']]):
+                if index_from_text:
                     tick = time.time()
                     _set_index_from_text(self.metadata, data_dir)
                     print("Finished indexing in", int(time.time() - tick), 'seconds')
@@ -273,19 +358,23 @@ class ResearchPapers:
                     print('Use index="text" if you want to index the texts of the paper instead')
                     tick = time.time()
 
-                    self.metadata['index_tokens'] = metadata.abstract.apply(preprocess)
+                    abstract_tokens = preprocess_parallel(metadata.abstract.fillna('').tolist())
+                    self.metadata['index_tokens'] = pd.Series(abstract_tokens, index=metadata.index)
                     tock = time.time()
                     print('Finished Indexing in', round(tock - tick, 0), 'seconds')
+                flat_tokens = flatten_tokens(self.metadata.index_tokens.tolist())
+                bm25_index = SparseBM25.from_flat(*flat_tokens)
+                _save_index_cache(cache_path, cache_index, flat_tokens, bm25_index)
 
-                if 'antivirals' not in self.metadata:
-                    # Add antiviral column
-                    self.metadata['antivirals'] = self.metadata.index_tokens \
-                        .apply(lambda t:
-                               ','.join([token for token in t if token.endswith('vir')]))
-            # Create BM25 search index
-            self.bm25 = _get_bm25Okapi(self.metadata.index_tokens)
-        else:
-            self.bm25 = bm25_index
+            # Rebuild the token lists from the flat tokens so that all lists share one string per token
+            self.metadata['index_tokens'] = pd.Series(unflatten_tokens(*flat_tokens), index=metadata.index)
+
+            if 'antivirals' not in self.metadata:
+                # Add antiviral column
+                self.metadata['antivirals'] = _get_antivirals(*flat_tokens, index=metadata.index)
+
+        # Create BM25 search index
+        self.bm25 = bm25_index if bm25_index is not None else _get_bm25_index(self.metadata.index_tokens)
 
     @staticmethod
     def load_metadata(data_path=None):
@@ -299,6 +388,8 @@ class ResearchPapers:
         metadata = pd.read_csv(metadata_path, dtype=dtypes, low_memory=False,
                                parse_dates=['publish_time']).rename(columns=renames)
         metadata = clean_metadata(metadata)
+        # Low cardinality columns take less memory and filter faster as categories
+        metadata = metadata.astype({col: 'category' for col in _CATEGORY_COLS if col in metadata})
         return metadata
 
     @classmethod
@@ -348,10 +439,10 @@ class ResearchPapers:
         _recs = []
         for id in paper_ids:
             paper = self[id]
-            _recs.append({'published': paper.metadata.published,
+            _recs.append({'published': paper.published,
                           'title': paper.title,
                           'summary': paper.summary,
-                          'when': paper.metadata.when,
+                          'when': paper.when,
                           'cord_uid': paper.cord_uid})
         df = pd.DataFrame(_recs).sort_values(['published'], ascending=False).drop(columns=['published'])
 
@@ -364,11 +455,10 @@ class ResearchPapers:
         print('Indexing research papers')
         tick = time.time()
         index_tokens = self._create_index_tokens()
+        flat_tokens = flatten_tokens(index_tokens.tolist())
         # Add antiviral column
-        self.metadata['antivirals'] = index_tokens.apply(lambda t:
-                                                         ','.join([token for token in t if token.endswith('vir')]))
-        # Does it have any covid term?
-        self.bm25 = BM25Okapi(index_tokens.tolist())
+        self.metadata['antivirals'] = _get_antivirals(*flat_tokens, index=index_tokens.index)
+        self.bm25 = SparseBM25.from_flat(*flat_tokens)
         tock = time.time()
         print('Finished Indexing in', round(tock - tick, 0), 'seconds')
 
@@ -381,11 +471,11 @@ class ResearchPapers:
 
     def __getitem__(self, item):
         if isinstance(item, int):
-            paper = self.metadata.iloc[item]
+            row = item
         else:
-            paper = self.metadata[self.metadata.cord_uid == item]
+            row = np.flatnonzero(self.metadata.cord_uid.values == item)[0]
 
-        return Paper(paper, self.data_path)
+        return Paper(self.metadata, self.data_path, row=row)
 
     def covid_related(self):
         return self.query('covid_related')
@@ -436,11 +526,20 @@ class ResearchPapers:
         return self.query('has_text')
 
     def contains(self, search_str, column='abstract'):
-        cond = self.metadata[column].fillna('').str.contains(search_str)
+        # Category columns cannot be filled with a value that is not one of their categories
+        values = self.metadata[column].astype(object).fillna('')
+        if _is_literal(search_str):
+            cond = values.str.contains(search_str, regex=False)
+        else:
+            cond = values.str.contains(re.compile(search_str))
         return self._make_copy(self.metadata[cond])
 
     def match(self, search_str, column='abstract'):
-        cond = self.metadata[column].fillna('').str.match(search_str)
+        values = self.metadata[column].astype(object).fillna('')
+        if _is_literal(search_str):
+            cond = values.str.startswith(search_str)
+        else:
+            cond = values.str.match(re.compile(search_str))
         return self._make_copy(self.metadata[cond])
 
     def head(self, n):
@@ -453,20 +552,23 @@ class ResearchPapers:
         return self._make_copy(self.metadata.sample(n).copy())
 
     def abstracts(self):
-        return pd.Series([self.__getitem__(i).abstract() for i in range(len(self))])
+        return self.metadata.abstract.reset_index(drop=True)
 
     def titles(self):
-        return pd.Series([self.__getitem__(i).title() for i in range(len(self))])
+        return self.metadata.title.reset_index(drop=True)
 
     def get_summary(self):
+        # Count all the tags in one reduction over the tag columns
+        covid_related, sars, coronavirus, virus = \
+            self.metadata[['covid_related', 'sars', 'coronavirus', 'virus']].to_numpy(dtype=bool).sum(axis=0)
         summary_df = pd.DataFrame({'Papers': [len(self.metadata)],
                                    'Oldest': [self.metadata.published.min()],
                                    'Newest': [self.metadata.published.max()],
-                                   'SARS-COV-2': [self.metadata.covid_related.sum()],
-                                   'SARS': [self.metadata.sars.sum()],
-                                   'Coronavirus': [self.metadata.coronavirus.sum()],
-                                   'Virus': [self.metadata.virus.sum()],
-                                   'Antivirals': [self.metadata.antivirals.apply(lambda a: len(a) > 0).sum()]},
+                                   'SARS-COV-2': [covid_related],
+                                   'SARS': [sars],
+                                   'Coronavirus': [coronavirus],
+                                   'Virus': [virus],
+                                   'Antivirals': [(self.metadata.antivirals.values != '').sum()]},
                                   index=[''])
         summary_df.Newest = summary_df.Newest.fillna('')
         summary_df.Oldest = summary_df.Oldest.fillna('')
@@ -479,19 +581,51 @@ class ResearchPapers:
 
     @staticmethod
     def from_pickle(save_dir='data'):
-        save_path = PurePath(save_dir) / _RESEARCH_PAPERS_SAVE_FILE
-        with open(save_path, 'rb') as f:
-            return pickle.load(f)
+        save_path = Path(save_dir) / _RESEARCH_PAPERS_SAVE_FILE
+        lz4_save_path = save_path.with_name(f'{save_path.name}.lz4')
+        lz4_open = _get_lz4_open()
+        if lz4_save_path.exists() and not lz4_open and not save_path.exists():
+            raise ImportError(f'{lz4_save_path} was saved with lz4. Install lz4 to load it')
+        # Load the most recent save that can be read
+        saves = [(path, open_fn) for path, open_fn in [(lz4_save_path, lz4_open), (save_path, open)]
+                 if open_fn and path.exists()]
+        path, open_fn = max(saves, key=lambda saved: saved[0].stat().st_mtime) if saves else (save_path, open)
+        with open_fn(path, 'rb') as f:
+            saved = pickle.load(f)
+
+        # Earlier saves hold only the research papers, with the index tokens in the metadata
+        papers, flat_tokens = saved if isinstance(saved, tuple) else (saved, None)
+        if flat_tokens is not None:
+            papers.metadata['index_tokens'] = pd.Series(unflatten_tokens(*flat_tokens), index=papers.metadata.index)
+        return papers
 
     def save(self, save_dir='data'):
-        save_path = PurePath(save_dir) / _RESEARCH_PAPERS_SAVE_FILE
+        """
+        Save the research papers as an lz4 compressed pickle, if lz4 is installed. The index tokens are saved as
+        flattened token ids, which pickle and load much faster than the token lists
+        """
+        save_path = Path(save_dir) / _RESEARCH_PAPERS_SAVE_FILE
+        lz4_save_path = save_path.with_name(f'{save_path.name}.lz4')
+        papers = copy.copy(self)
+        papers.metadata = self.metadata.drop(columns=['index_tokens'], errors='ignore')
+        flat_tokens = flatten_tokens(self.metadata.index_tokens.tolist()) if 'index_tokens' in self.metadata else None
+        open_fn = _get_lz4_open()
+        if open_fn:
+            save_path, stale_path = lz4_save_path, save_path
+        else:
+            open_fn, stale_path = open, lz4_save_path
         print('Saving to', save_path)
-        with open(save_path, 'wb') as f:
-            pickle.dump(self, f)
+        with open_fn(save_path, 'wb') as f:
+            pickle.dump((papers, flat_tokens), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Remove the files of an earlier save so that from_pickle does not load them with this save
+        for path in [stale_path, Path(save_dir) / _RESEARCH_PAPERS_TOKENS_FILE]:
+            if path.exists():
+                path.unlink()
 
     def _create_index_tokens(self):
-        abstract_tokens = self.metadata.abstract.apply(preprocess)
-        return abstract_tokens
+        abstract_tokens = preprocess_parallel(self.metadata.abstract.fillna('').tolist())
+        return pd.Series(abstract_tokens, index=self.metadata.index)
 
     def search_2d(self, search_string,
                   num_results=25,
@@ -511,26 +645,30 @@ class ResearchPapers:
         search_terms = preprocess(search_string)
         doc_scores = self.bm25.get_scores(search_terms)
 
-        # Get the index from the doc scores
-        ind = np.argsort(doc_scores)[::-1]
-        results = self.metadata.iloc[ind].copy()
-        results['Score'] = doc_scores[ind].round(1)
-        # paper_ids = find_similar_papers(search_string, num_items=50)
-        # results = self.metadata[self.metadata.cord_uid.isin(paper_ids)]
+        # Filter before ranking so that only the top n_results need to be sorted
+        keep = np.ones(len(doc_scores), dtype=bool)
 
         # Filter covid related
         if covid_related:
-            results = results[results.covid_related]
+            keep &= self.metadata.covid_related.values
 
         # Filter by dates
         if start_date:
-            results = results[results.published >= start_date]
+            keep &= (self.metadata.published >= start_date).values
 
         if end_date:
-            results = results[results.published < end_date]
-
-        # Show only up to n_results
-        results = results.head(num_results)
+            keep &= (self.metadata.published < end_date).values
+
+        # Get the index of the top n_results from the doc scores
+        candidates = np.flatnonzero(keep)
+        k = min(n_results, len(candidates))
+        if k < len(candidates):
+            candidates = candidates[np.argpartition(-doc_scores[candidates], k - 1)[:k]]
+        ind = candidates[np.argsort(-doc_scores[candidates], kind='stable')]
+        results = self.metadata.iloc[ind].copy()
+        results['Score'] = doc_scores[ind].astype(np.float64).round(1)
+        # paper_ids = find_similar_papers(search_string, num_items=50)
+        # results = self.metadata[self.metadata.cord_uid.isin(paper_ids)]
 
         # Create the final results
         results = results.drop_duplicates(subset=['title'])
@@ -622,27 +760,68 @@ class Paper:
     A single research paper
     '''
 
-    def __init__(self, item, data_path):
-        if isinstance(item, pd.DataFrame):
-            # convert to a series
-            item = item.T.iloc[:, 0]
+    __slots__ = ('_data', '_row', '_metadata', 'data_path')
 
-        self.metadata = item
-        self.sha = item.sha
-        self.pmcid = item.pmcid
-        self.cord_uid = item.cord_uid
+    def __init__(self, item, data_path, row=None):
+        """
+        :param item: the metadata row of the paper, or a metadata frame with the paper at position row
+        :param data_path: the path to the CORD data
+        :param row: the position of the paper in the metadata frame. Defaults to the first row
+        """
+        if isinstance(item, pd.DataFrame):
+            # Read the columns of the row from the frame when needed instead of copying the row
+            self._data, self._row, self._metadata = item, row or 0, None
+        else:
+            self._data, self._row, self._metadata = None, None, item
         self.data_path = data_path
-        self.pmc_json_files = item.pmc_json_files
-        self.pdf_json_files = item.pdf_json_files
+
+    def _get(self, column):
+        if self._metadata is not None:
+            return self._metadata[column]
+        return self._data[column].iat[self._row]
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = self._data.iloc[self._row]
+        return self._metadata
+
+    @property
+    def sha(self):
+        return self._get('sha')
+
+    @property
+    def pmcid(self):
+        return self._get('pmcid')
+
+    @property
+    def cord_uid(self):
+        return self._get('cord_uid')
+
+    @property
+    def pmc_json_files(self):
+        return self._get('pmc_json_files')
+
+    @property
+    def pdf_json_files(self):
+        return self._get('pdf_json_files')
+
+    @property
+    def published(self):
+        return self._get('published')
+
+    @property
+    def when(self):
+        return self._get('when')
 
     def get_json_paper(self):
-        if isinstance(self.metadata.pmc_json_files, str):
+        if isinstance(self.pmc_json_files, str):
             return self.get_pmc_json()
-        elif isinstance(self.metadata.pdf_json_files, str):
+        elif isinstance(self.pdf_json_files, str):
             return self.get_pdf_json()
 
     def get_pdf_json_path(self):
-        if self.metadata.pdf_json_files:
+        if self.pdf_json_files:
             return self.data_path / self.pdf_json_files.partition(';')[0]
 
     def get_pdf_json(self):
@@ -651,24 +830,24 @@ class Paper:
             return load_json_paper(path)
 
     def get_pmc_json(self):
-        path = self.data_path / self.metadata.pmc_json_files
+        path = self.data_path / self.pmc_json_files
         print(path, path.exists())
         if path and path.exists():
             return load_json_paper(path)
 
     @property
     def url(self):
-        if not isinstance(self.metadata.url, str):
+        if not isinstance(self._get('url'), str):
             return None
-        for url in self.metadata.url.split(';'):
+        for url in self._get('url').split(';'):
             if not 'api.elsevier.com' in url:
                 return url.strip()
 
     @property
     def api_url(self):
-        if not isinstance(self.metadata.url, str):
+        if not isinstance(self._get('url'), str):
             return None
-        for url in self.metadata.url.split(';'):
+        for url in self._get('url').split(';'):
             if 'api.elsevier.com' in url:
                 return url.strip()
 
@@ -689,7 +868,7 @@ class Paper:
 
     @property
     def abstract(self):
-        return self.metadata.abstract
+        return self._get('abstract')
 
     @property
     def summary(self):
@@ -701,10 +880,10 @@ class Paper:
 
     @property
     def title(self):
-        return self.metadata.title
+        return self._get('title')
 
     def has_text(self):
-        return self.paper.has_text
+        return self._get('has_text')
 
     @property
     def authors(self, split=False):
@@ -714,7 +893,7 @@ class Paper:
         '''
         Get a list of authors
         '''
-        authors = self.metadata.authors
+        authors = self._get('authors')
         if not authors:
             return []
         if not split:
@@ -727,9 +906,8 @@ class Paper:
         return [a.strip() for a in authors.split(';')]
 
     def _repr_html_(self):
-        paper_meta = self.metadata.to_frame().T
-        paper_meta = paper_meta[['published', 'authors', 'cord_uid', 'url', ]]
-        paper_meta.index = ['']
+        paper_meta = pd.DataFrame([{col: self._get(col) for col in ['published', 'authors', 'cord_uid', 'url']}],
+                                  index=[''])
 
         return render_html('Paper', paper=self, meta=paper_meta)
 
@@ -739,14 +917,17 @@ class SearchResults:
     def __init__(self, data: pd.DataFrame, data_path, view='html'):
         self.data_path = data_path
         self.results = data.dropna(subset=['title'])
-        self.results.authors = self.results.authors.apply(str).replace("'", '').replace('[', '').replace(']', '')
-        self.results['url'] = self.results.doi.apply(doi_url)
+        self.results['authors'] = self.results.authors.astype(str).str.translate(_AUTHOR_PUNCTUATION)
+        # Convert the doi to a url
+        doi = self.results.doi.fillna('')
+        self.results['url'] = np.where(doi == '', '#',
+                                       np.where(doi.str.startswith('doi.org'), 'http://' + doi, 'http://doi.org/' + doi))
         self.results['summary'] = self.results.abstract.apply(summarize)
         self.columns = [col for col in ['sha', 'title', 'summary', 'when'] if col in self.results]
         self.view = view
 
     def __getitem__(self, item):
-        return Paper(self.results.loc[item], self.data_path)
+        return Paper(self.results, self.data_path, row=self.results.index.get_loc(item))
 
     def __len__(self):
         return len(self.results)
@@ -755,7 +936,7 @@ class SearchResults:
         _results = [{'title': rec['title'],
                      'authors': shorten(rec['authors'], 200),
                      'abstract': shorten(rec['abstract'], 300),
-                     'summary': shorten(summarize(rec['abstract']), 500),
+                     'summary': shorten(rec['summary'], 500),
                      'when': rec['when'],
                      'url': rec['url'],
                      'cord_uid': rec['cord_uid'],
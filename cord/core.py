@@ -5,7 +5,7 @@ import math
 import multiprocessing
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Collection, Any
 
@@ -73,8 +73,8 @@ def cord_support_dir():
     return Path(__file__).parent / 'cordsupport'
 
 
-def cord_cache_dir():
-    return Path(find_data_dir()).parent / 'cord-cache'
+def cord_cache_dir(data_path=None):
+    return Path(data_path or find_data_dir()).parent / 'cord-cache'
 
 
 def num_cpus() -> int:
@@ -126,6 +126,13 @@ def parallel(func, arr: Collection, max_workers: int = None, leave=False):
     return [result for i, result in results]
 
 
+def parallel_processes(func, arr: Collection, max_workers: int = None, chunksize: int = 64):
+    "Call `func` on every element of `arr` in separate processes using `max_workers`, keeping the order of `arr`."
+    max_workers = ifnone(max_workers, num_cpus())
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        return list(tqdm(ex.map(func, arr, chunksize=chunksize), total=len(arr)))
+
+
 def add(cat1, cat2):
     return cat1 + cat2
 
@@ -7,13 +7,14 @@ YYYY_MON_DD = '\d{4} \w{3} \d{1,2}$'
 YYYY_MON = '\d{4} \w{3}$'
 YYYY = '\d{4}$'
 YYYY_MM_DD = '\d{4}\-\d{2}\-\d{2}$'
+_YYYY_MON_DD_PATTERN = re.compile(YYYY_MON_DD)
 
 
 def format_date(date, format):
     try:
         return pd.to_datetime(date, format=format)
     except ValueError:
-        if re.match(YYYY_MON_DD, date):
+        if _YYYY_MON_DD_PATTERN.match(date):
             date = f'{date[:8]} 28'
             return pd.to_datetime(date, format=format)
         return f'ValueError'
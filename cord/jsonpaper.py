@@ -3,7 +3,7 @@ from functools import partial, reduce, lru_cache
 import simplejson as json
 import pandas as pd
 import numpy as np
-from .core import parallel, render_html, listify, add, CORD_CHALLENGE_PATH, BIORXIV_MEDRXIV, \
+from .core import parallel, parallel_processes, render_html, listify, add, CORD_CHALLENGE_PATH, BIORXIV_MEDRXIV, \
     NONCOMM_USE_SUBSET, CUSTOM_LICENSE, COMM_USE_SUBSET, find_data_dir
 from pathlib import Path, PurePath
 import pickle
@@ -13,6 +13,11 @@ from typing import Dict, List
 from gensim.corpora import Dictionary
 import time
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 _JSON_CATALOG_SAVEFILE = 'JsonCatalog'
 PDF_JSON = 'pdf_json'
 PMC_JSON = 'pmc_json'
@@ -125,25 +130,21 @@ def get_json_paths(metadata: pd.DataFrame, data_path, first=True, tolist=False)
     """
     :param metadata: The CORD Research Metadata
     :param data_path: The path to the CORD data
+    :param first: if tolist, return only the first json file of each paper instead of all of them
+    :param tolist: return a list of the paths instead of a series
     :return: a series containing the paths to the JSONS .. will contain nans
     """
-    paths_df = metadata[['source']].copy()
-    data_path = Path(data_path)
+    json_files = metadata.pmc_json_files.fillna(metadata.pdf_json_files).astype(object).rename('json_path')
 
-    def path_fn(path):
-        if isinstance(path, str):
-            return [data_path / p.strip() for p in path.split(';')]
-        return np.nan
-    paths_df['json_path'] = metadata.pmc_json_files.fillna(metadata.pdf_json_files).apply(path_fn)
+    if tolist and not first:
+        all_json_files = json_files.dropna().str.split(';').explode().str.strip()
+        return (str(data_path) + '/' + all_json_files).map(Path).tolist()
 
+    first_json_files = json_files.str.split(';').str[0].str.strip()
+    json_paths = (str(data_path) + '/' + first_json_files).map(Path, na_action='ignore')
     if tolist:
-        if first:
-            paths_df.json_path.apply(get_first_json).dropna().tolist()
-        else:
-            path_list = paths_df.json_path.apply(lambda p: [a.strip() for a in p.split(';')]).tolist()
-            return [a for ps in path_list for a in ps]
-    else:
-        return paths_df.json_path.apply(get_first_json)
+        return json_paths.dropna().tolist()
+    return json_paths
 
 
 class JsonPaper:
@@ -207,23 +208,31 @@ class JsonPaper:
         return 'JsonPaper'
 
 
-@lru_cache(maxsize=1024)
-def load_json_file(json_file):
+def read_json(json_file):
+    """
+    Read a json file, parsing it with orjson if it is installed
+    :param json_file:
+    :return: the parsed json
+    """
+    if orjson:
+        return orjson.loads(Path(json_file).read_bytes())
     with Path(json_file).open('r') as f:
         return json.load(f)
 
 
+@lru_cache(maxsize=1024)
+def load_json_file(json_file):
+    return read_json(json_file)
+
+
 def load_json_paper(json_file):
-    with Path(json_file).open('r') as f:
-        contents = json.load(f)
-    return JsonPaper(contents)
+    return JsonPaper(read_json(json_file))
 
 
 def load_text_body_from_file(json_path):
-    with json_path.open('r') as f:
-        json_content = json.load(f)
-        body_text = get_text(json_content, 'body_text')
-        authors = get_authors(json_content)
+    json_content = read_json(json_path)
+    body_text = get_text(json_content, 'body_text')
+    authors = get_authors(json_content)
     sha = json_path.stem
     return sha, body_text, authors
 
@@ -234,10 +243,7 @@ def load_text(json_path):
     :param json_path:
     :return: the text body of the json file
     """
-    with json_path.open('r') as f:
-        json_content = json.load(f)
-        body_text = get_text(json_content, 'body_text')
-    return body_text
+    return get_text(read_json(json_path), 'body_text')
 
 
 def load_tokens_from_file(json_path):
@@ -265,7 +271,7 @@ def load_json_texts(json_dirs=None, tokenize=False):
         json_path = Path(data_path) / json_dir / json_dir
         print('Loading json from', json_path.stem)
         load_fn = load_tokens_from_file if tokenize else load_text_body_from_file
-        sha_texts_authors = parallel(load_fn, list_json_files_in(json_path))
+        sha_texts_authors = parallel_processes(load_fn, list_json_files_in(json_path))
         text_dfs.append(pd.DataFrame(sha_texts_authors, columns=['sha', 'text', 'authors']))
     text_df = pd.concat(text_dfs, ignore_index=True)
 
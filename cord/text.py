@@ -1,18 +1,27 @@
 import calendar
 import re
+from functools import lru_cache
+from multiprocessing import Pool
 
 import nltk
+import pandas as pd
 
+from .bm25 import flatten_tokens, unflatten_tokens
+from .core import num_cpus
 from .stopwords import SIMPLE_STOPWORDS
 from gensim.summarization import summarizer
 from gensim.summarization.textcleaner import get_sentences
 
 TOKEN_PATTERN = re.compile('^(20|19)\d{2}|(?=[A-Z])[\w\-\d]+$', re.IGNORECASE)
+PUNCTUATION_PATTERN = re.compile('\(|\)|:|,|;|\.|’|”|“|\?|%|>|<|≥|≤|~|`')
+# Characters that nltk.word_tokenize would split on but str.split does not, including dashes and double hyphens.
+# It also splits on + = | which nltk keeps inside a word, so that words joined by them are not dropped
+SEPARATOR_PATTERN = re.compile('--|[/\[\]{}!"*=+&|@#$—–‘«»]')
 
 
 def replace_punctuation(text):
-    t = re.sub('\(|\)|:|,|;|\.|’|”|“|\?|%|>|<|≥|≤|~|`', '', text)
-    t = re.sub('/', ' ', t)
+    t = PUNCTUATION_PATTERN.sub('', text)
+    t = t.replace('/', ' ')
     t = t.replace("'", '')
     return t
 
@@ -23,8 +32,7 @@ def clean(text):
     return t
 
 
-def tokenize(text):
-    words = nltk.word_tokenize(text)
+def filter_tokens(words):
     return [word for word in words
             if len(word) > 1
             and not word in SIMPLE_STOPWORDS
@@ -35,9 +43,58 @@ def tokenize(text):
             ]
 
 
+def tokenize(text):
+    words = nltk.word_tokenize(text)
+    return filter_tokens(words)
+
+
 def preprocess(text):
+    # Split the same way as preprocess_batch so that search terms match the indexed tokens
     t = clean(text)
-    tokens = tokenize(t)
+    words = SEPARATOR_PATTERN.sub(' ', t).split()
+    return filter_tokens(words)
+
+
+def preprocess_batch(texts):
+    """
+    Preprocess a list of texts in one vectorized pass instead of calling preprocess on each text
+    :param texts: a list of texts
+    :return: a list with the tokens for each text
+    """
+    words = pd.Series(texts, dtype=object).fillna('') \
+        .str.lower() \
+        .str.replace(PUNCTUATION_PATTERN, '', regex=True) \
+        .str.replace("'", '', regex=False) \
+        .str.replace(SEPARATOR_PATTERN, ' ', regex=True) \
+        .str.split()
+    return [filter_tokens(doc_words) for doc_words in words]
+
+
+def _preprocess_flat(texts):
+    return flatten_tokens(preprocess_batch(texts))
+
+
+def preprocess_parallel(texts, chunk_size=2048, max_workers=None):
+    """
+    Preprocess a list of texts by running preprocess_batch on chunks of the texts in separate processes
+    :param texts: a list of texts
+    :param chunk_size: the number of texts sent to each call of preprocess_batch
+    :param max_workers: the number of processes. Defaults to the number of cpus
+    :return: a list with the tokens for each text, in the same order as the texts
+    """
+    workers = max_workers or num_cpus()
+    if workers <= 1 or len(texts) <= chunk_size:
+        return preprocess_batch(texts)
+    chunks = [texts[i: i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with Pool(workers) as pool:
+        # The workers send back token ids, which are smaller and faster to unpickle than the lists of strings
+        flat_chunks = pool.map(_preprocess_flat, chunks)
+    strings = {}
+    tokens = []
+    for vocab, token_ids, offsets in flat_chunks:
+        # Share one string per token across the chunks
+        vocab = {strings.setdefault(token, token): token_id for token, token_id in vocab.items()}
+        tokens.extend(unflatten_tokens(vocab, token_ids, offsets))
     return tokens
 
 
@@ -69,6 +126,7 @@ def num_sentences(text):
     return len(list(get_sentences(text)))
 
 
+@lru_cache(maxsize=8192)
 def summarize(text, word_count=120):
     if num_sentences(text) > 1:
         try:
@@ -14,8 +14,9 @@ with open('LICENSE') as f:
     license = f.read()
 
 EXTRAS_REQUIRES = {'nlp': ['allennlp', 'torch==1.4.0', 'scispacy'],
-                   'ui': ['streamlit']}
-EXTRAS_REQUIRES['all'] = EXTRAS_REQUIRES['nlp'] + EXTRAS_REQUIRES['ui']
+                   'ui': ['streamlit'],
+                   'fast': ['numba', 'lz4', 'orjson']}
+EXTRAS_REQUIRES['all'] = EXTRAS_REQUIRES['nlp'] + EXTRAS_REQUIRES['ui'] + EXTRAS_REQUIRES['fast']
 setup(
     name='cord19',
     version='0.4.0',
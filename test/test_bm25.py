@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from rank_bm25 import BM25Okapi
+
+from cord.bm25 import SparseBM25, flatten_tokens, unflatten_tokens, _score_postings, _score_postings_numpy
+
+CORPUS = [['coronavirus', 'spike', 'protein', 'binding', 'ace2', 'receptor'],
+          ['remdesivir', 'trial', 'covid-19', 'patients', 'remdesivir'],
+          ['bats', 'coronavirus', 'reservoir', 'coronavirus', 'strains'],
+          [],
+          ['influenza', 'vaccine', 'trial', 'children'],
+          ['covid-19', 'wuhan', 'outbreak', 'coronavirus', 'patients', 'ace2']]
+
+QUERIES = [['coronavirus'],
+           ['remdesivir', 'trial'],
+           ['coronavirus', 'coronavirus', 'ace2'],
+           ['covid-19', 'not-in-vocab'],
+           ['not-in-vocab'],
+           []]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_scores_match_bm25okapi(query):
+    expected = BM25Okapi(CORPUS).get_scores(query)
+    np.testing.assert_allclose(SparseBM25(CORPUS).get_scores(query), expected, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_from_flat_matches_bm25okapi(query):
+    expected = BM25Okapi(CORPUS).get_scores(query)
+    np.testing.assert_allclose(SparseBM25.from_flat(*flatten_tokens(CORPUS)).get_scores(query), expected,
+                               rtol=1e-5, atol=1e-6)
+
+
+def test_numpy_scores_match_compiled_scores():
+    bm25 = SparseBM25(CORPUS)
+    query_term_ids = np.array([bm25.vocab[term] for term in ['coronavirus', 'coronavirus', 'trial']], dtype=np.int32)
+    args = bm25.indptr, bm25.doc_ids, bm25.weights, query_term_ids, bm25.corpus_size
+    np.testing.assert_allclose(_score_postings(*args), _score_postings_numpy(*args))
+
+
+def test_empty_corpus():
+    bm25 = SparseBM25([])
+    assert len(bm25) == 0
+    assert len(bm25.get_scores(['coronavirus'])) == 0
+    assert len(bm25.get_scores([])) == 0
+
+
+def test_flatten_tokens_round_trip():
+    vocab, token_ids, offsets = flatten_tokens(CORPUS)
+    assert token_ids.dtype == np.int32
+    assert offsets.dtype == np.int64
+    assert len(offsets) == len(CORPUS) + 1
+    assert len(vocab) == len({token for document in CORPUS for token in document})
+    assert unflatten_tokens(vocab, token_ids, offsets) == CORPUS
+
+
+def test_flatten_empty_corpus_round_trip():
+    assert unflatten_tokens(*flatten_tokens([])) == []
+    assert unflatten_tokens(*flatten_tokens([[], []])) == [[], []]
@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from cord.jsonpaper import get_json_paths
+
+DATA_PATH = Path('data') / 'CORD-19-research-challenge'
+
+
+def _metadata():
+    return pd.DataFrame({'pmc_json_files': ['document_parses/pmc_json/PMC1.xml.json', None,
+                                            'document_parses/pmc_json/PMC3.xml.json', None],
+                         'pdf_json_files': ['document_parses/pdf_json/a1.json',
+                                            'document_parses/pdf_json/b2.json; document_parses/pdf_json/b3.json',
+                                            'document_parses/pdf_json/c4.json', None]},
+                        index=[10, 11, 12, 13])
+
+
+def test_get_json_paths():
+    json_paths = get_json_paths(_metadata(), DATA_PATH)
+    assert isinstance(json_paths, pd.Series)
+    assert json_paths.index.tolist() == [10, 11, 12, 13]
+    assert json_paths.iloc[:3].tolist() == [DATA_PATH / 'document_parses/pmc_json/PMC1.xml.json',
+                                            DATA_PATH / 'document_parses/pdf_json/b2.json',
+                                            DATA_PATH / 'document_parses/pmc_json/PMC3.xml.json']
+    assert pd.isnull(json_paths.iloc[3])
+
+
+def test_get_json_paths_tolist():
+    assert get_json_paths(_metadata(), DATA_PATH, tolist=True) == \
+           [DATA_PATH / 'document_parses/pmc_json/PMC1.xml.json',
+            DATA_PATH / 'document_parses/pdf_json/b2.json',
+            DATA_PATH / 'document_parses/pmc_json/PMC3.xml.json']
+
+
+def test_get_json_paths_tolist_all_files():
+    assert get_json_paths(_metadata(), DATA_PATH, first=False, tolist=True) == \
+           [DATA_PATH / 'document_parses/pmc_json/PMC1.xml.json',
+            DATA_PATH / 'document_parses/pdf_json/b2.json',
+            DATA_PATH / 'document_parses/pdf_json/b3.json',
+            DATA_PATH / 'document_parses/pmc_json/PMC3.xml.json']
+
+
+def test_get_json_paths_all_null():
+    metadata = pd.DataFrame({'pmc_json_files': [None, np.nan], 'pdf_json_files': [np.nan, None]})
+    assert get_json_paths(metadata, DATA_PATH).isnull().all()
+    assert get_json_paths(metadata, DATA_PATH, tolist=True) == []
+    assert get_json_paths(metadata, DATA_PATH, first=False, tolist=True) == []
@@ -0,0 +1,106 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+from cord.core import SARS_COV_2_DATE
+from cord.cord19 import find_tags, clean_metadata, remove_common_terms, COVID_TERMS, _TAG_PATTERNS, _relevant_re_
+from cord.dates import add_date_diff
+
+# The str.match patterns used by the tag_* functions before the tags were found in one pass
+TAG_SEARCHES = {'covid': f".*({'|'.join(COVID_TERMS)})",
+                'wuhan': '.*(wuhan|hubei)',
+                'virus': '.*(virus|viruses|viral)',
+                'coronavirus': '.*corona',
+                'sars': '.*sars'}
+
+ABSTRACTS = ['The novel coronavirus outbreak in Wuhan',
+             'SARS-CoV-2 spike protein',
+             'Severe acute respiratory syndrome (SARS) coronavirus',
+             'sars coronavirus 2 and viral shedding',
+             'Influenza vaccines for children',
+             'First line about influenza\nThe second line mentions COVID-19 and the novel coronavirus',
+             'Viral loads\nin Hubei',
+             '\nCoronavirus on the second line',
+             '']
+
+
+def test_find_tags_matches_tag_searches():
+    tags = find_tags(pd.Series(ABSTRACTS + [None]))
+    assert list(tags.columns) == list(_TAG_PATTERNS)
+    for tag in _TAG_PATTERNS:
+        expected = [bool(re.match(TAG_SEARCHES[tag], abstract or '', re.IGNORECASE)) for abstract in ABSTRACTS + [None]]
+        assert tags[tag].tolist() == expected, tag
+
+
+def test_find_tags_searches_the_first_line():
+    tags = find_tags(pd.Series(['Influenza\nCOVID-19 in Wuhan', 'COVID-19 in Wuhan\nInfluenza']))
+    assert tags.to_dict('list') == {'covid': [False, True], 'wuhan': [False, True], 'virus': [False, False],
+                                    'coronavirus': [False, False], 'sars': [False, False]}
+
+
+def _old_clean_metadata(metadata):
+    """
+    The clean_metadata pipeline with the original row by row cleaning and str.match tags
+    """
+    data = metadata.copy()
+    title_relevant = data.title.fillna('').str.match(_relevant_re_, case=False)
+    title_short = data.title.fillna('').apply(len) < 30
+    data.loc[title_short & ~title_relevant, 'title'] = ''
+
+    data.loc[data.abstract == 'Unknown', 'abstract'] = np.nan
+    data.abstract = data.abstract.fillna(data.title)
+    data.abstract = data.abstract.fillna('').apply(remove_common_terms)
+    abstract_counts = data.abstract.value_counts()
+    abstract_counts = abstract_counts[abstract_counts > 1].head(20)
+    common_abstracts = [a for a, count in abstract_counts.items() if count > 2 and a != '']
+    data.loc[data.abstract.isin(common_abstracts), 'abstract'] = ''
+
+    data = add_date_diff(data.rename(columns={'publish_time': 'published'}))
+    missing = data.published.isnull() & data.sha.isnull() & (data.title == '') & (data.abstract == '')
+    data = data[~missing].reset_index(drop=True)
+    for column in ['authors', 'doi', 'journal', 'abstract']:
+        data[column] = data[column].fillna('')
+
+    since_covid = (data.published > SARS_COV_2_DATE) | data.published.isnull()
+    data['covid_related'] = since_covid & (data.abstract.str.match(TAG_SEARCHES['covid'], case=False) |
+                                           data.abstract.str.match(TAG_SEARCHES['wuhan'], case=False))
+    for tag in ['virus', 'coronavirus', 'sars']:
+        data[tag] = data.abstract.str.match(TAG_SEARCHES[tag], case=False)
+    data['sars'] = data.sars & ~data.covid_related
+    return data
+
+
+@pytest.mark.parametrize('dtype', [object, 'str'])
+def test_clean_metadata_matches_old_pipeline(dtype):
+    copyright_abstract = 'Publisher Summary This chapter is about viral infections'
+    metadata = pd.DataFrame({
+        'sha': ['s1', 's2', None, 's4', 's5', 's6', 's7', None, 's9', 's10'],
+        'title': ['Novel coronavirus pneumonia in Wuhan, a case series', 'SARS', 'Short title', None,
+                  'Severe acute respiratory syndrome in Hong Kong hospitals', 'Influenza vaccination of children',
+                  'Viral shedding', None, 'Remdesivir for patients with COVID-19', 'Bats as reservoirs of viruses'],
+        'abstract': ['Abstract We describe 41 patients with a novel coronavirus\nin Wuhan, Hubei',
+                     'Unknown',
+                     None,
+                     None,
+                     'BACKGROUND Influenza like illness\nSARS coronavirus was isolated from patients',
+                     copyright_abstract,
+                     copyright_abstract,
+                     None,
+                     copyright_abstract,
+                     'Bats carry many viruses.\nSome of them are coronaviruses related to SARS-CoV-2'],
+        'publish_time': pd.to_datetime(['2020-01-24', '2003-05-01', None, '2020-03-01', '2003-04-10',
+                                        '2015-06-01', None, None, '2020-04-29', '2019-12-01']),
+        'authors': ['Huang, C.', None, 'Doe, J.', None, 'Peiris, J.', 'Smith, A.', None, None, 'Wang, Y.',
+                    'Li, W.'],
+        'doi': ['10.1/a', None, None, '10.1/d', '10.1/e', None, None, None, '10.1/i', '10.1/j'],
+        'journal': ['Lancet', 'Nature', None, None, 'Lancet', 'Vaccine', None, None, 'Lancet', 'Science']})
+    metadata = metadata.astype({col: dtype for col in ['sha', 'title', 'abstract', 'authors', 'doi', 'journal']})
+
+    expected = _old_clean_metadata(metadata)
+    cleaned = clean_metadata(metadata)
+    pd.testing.assert_frame_equal(cleaned, expected, check_like=True, check_dtype=False)
+    # Terms after the first line of an abstract are not tagged
+    assert cleaned.covid_related.tolist() == [True, False, False, False, False, False, False, False]
+    assert cleaned.coronavirus.tolist() == [True, False, False, False, False, False, False, False]
+    assert cleaned.virus.tolist() == [True, False, False, False, False, False, False, True]
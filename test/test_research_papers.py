@@ -1,6 +1,213 @@
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
 import pytest
-from cord.cord19 import ResearchPapers
+from cord.bm25 import SparseBM25
+from cord.cord19 import Paper, ResearchPapers, _INDEX_CACHE_VERSION, _get_index_cache_path, _load_index_cache
+from cord.text import preprocess
 
 def test_load_research_papers():
     print('Loading research papers')
-    reseearch_paper = ResearchPapers.load()
\ No newline at end of file
+    reseearch_paper = ResearchPapers.load()
+
+def _metadata():
+    return pd.DataFrame({'sha': ['a1', 'b2', 'c3'],
+                         'cord_uid': ['u1', 'u2', 'u3'],
+                         'title': ['Remdesivir trial', 'Coronavirus in bats', 'Influenza vaccines'],
+                         'abstract': ['Remdesivir was tested on patients with covid-19',
+                                      'Bats carry many coronavirus strains',
+                                      None],
+                         'authors': ["['Wang, Y.', 'Li, W.']", 'Smith, A.', None],
+                         'doi': ['10.1016/a1', 'doi.org/10.1016/b2', None]})
+
+
+def test_bm25_index_is_cached(tmp_path):
+    data_dir = tmp_path / 'data'
+    papers = ResearchPapers(_metadata(), data_dir=data_dir)
+    cache_path = _get_index_cache_path(_metadata(), data_dir, 'abstract')
+    assert cache_path.exists()
+    assert f'_v{_INDEX_CACHE_VERSION}_' in cache_path.name
+
+    cached_papers = ResearchPapers(_metadata(), data_dir=data_dir)
+    assert cached_papers.metadata.index_tokens.tolist() == papers.metadata.index_tokens.tolist()
+    assert cached_papers.metadata.antivirals.tolist() == ['remdesivir', '', '']
+    np.testing.assert_array_equal(cached_papers.bm25.get_scores(['remdesivir']),
+                                  papers.bm25.get_scores(['remdesivir']))
+
+
+def test_bm25_index_cache_replaces_older_caches(tmp_path):
+    data_dir = tmp_path / 'data'
+    ResearchPapers(_metadata(), data_dir=data_dir)
+    cache_dir = _get_index_cache_path(_metadata(), data_dir, 'abstract').parent
+    (cache_dir / 'bm25_text_v1_other.pkl').touch()
+
+    changed_metadata = _metadata()
+    changed_metadata.loc[2, 'abstract'] = 'Influenza vaccines for children'
+    ResearchPapers(changed_metadata, data_dir=data_dir)
+    assert sorted(path.name for path in cache_dir.glob('bm25_*.pkl')) == \
+        sorted(['bm25_text_v1_other.pkl', _get_index_cache_path(changed_metadata, data_dir, 'abstract').name])
+
+
+@pytest.mark.parametrize('cached', [(['old', 'tokens'], None, None),
+                                    ([['remdesivir'], ['bats'], []], SparseBM25([['remdesivir'], ['bats'], []]))])
+def test_invalid_bm25_index_cache_is_rebuilt(tmp_path, cached):
+    data_dir = tmp_path / 'data'
+    cache_path = _get_index_cache_path(_metadata(), data_dir, 'abstract')
+    cache_path.parent.mkdir(parents=True)
+    with cache_path.open('wb') as f:
+        pickle.dump(cached, f)
+
+    papers = ResearchPapers(_metadata(), data_dir=data_dir)
+    assert papers.bm25.get_scores(['remdesivir'])[0] > 0
+    assert isinstance(_load_index_cache(cache_path, 3)[1], SparseBM25)
+
+
+def _indexed_papers():
+    metadata = _metadata()
+    metadata['index_tokens'] = [['remdesivir', 'covid-19'], ['bats', 'coronavirus'], []]
+    metadata['full_text_file'] = pd.Series(['comm_use_subset', None, 'noncomm_use_subset'], dtype='category')
+    metadata['license'] = pd.Series(['cc-by', 'els-covid', None], dtype='category')
+    metadata['has_text'] = [True, False, True]
+    metadata['pmcid'] = ['PMC1', None, None]
+    metadata['pmc_json_files'] = ['document_parses/pmc_json/PMC1.xml.json', None, None]
+    metadata['pdf_json_files'] = ['document_parses/pdf_json/a1.json', None,
+                                  'document_parses/pdf_json/c3.json; document_parses/pdf_json/c4.json']
+    metadata['url'] = ['https://doi.org/10.1016/a1; https://api.elsevier.com/content/a1', None,
+                       'https://www.ncbi.nlm.nih.gov/pmc/articles/PMC3']
+    return ResearchPapers(metadata)
+
+
+def test_contains_category_column_with_nulls():
+    papers = _indexed_papers()
+    assert papers.contains('comm', column='full_text_file').metadata.cord_uid.tolist() == ['u1', 'u3']
+    assert papers.contains('^comm', column='full_text_file').metadata.cord_uid.tolist() == ['u1']
+    assert papers.contains('covid', column='license').metadata.cord_uid.tolist() == ['u2']
+
+
+def test_match_category_column_with_nulls():
+    papers = _indexed_papers()
+    assert papers.match('comm', column='full_text_file').metadata.cord_uid.tolist() == ['u1']
+    assert papers.match('.*comm', column='full_text_file').metadata.cord_uid.tolist() == ['u1', 'u3']
+    assert papers.match('els', column='license').metadata.cord_uid.tolist() == ['u2']
+
+
+def _assert_same_papers(loaded, papers):
+    pd.testing.assert_frame_equal(loaded.metadata, papers.metadata, check_like=True)
+    np.testing.assert_array_equal(loaded.bm25.get_scores(['remdesivir']), papers.bm25.get_scores(['remdesivir']))
+
+
+def test_save_and_load(tmp_path):
+    papers = _indexed_papers()
+    papers.save(tmp_path)
+    assert (tmp_path / 'ResearchPapers.pickle.lz4').exists()
+    assert not (tmp_path / 'ResearchPapers.pickle').exists()
+    _assert_same_papers(ResearchPapers.from_pickle(tmp_path), papers)
+
+
+def test_save_and_load_without_lz4(tmp_path, monkeypatch):
+    papers = _indexed_papers()
+    papers.save(tmp_path)
+    monkeypatch.setitem(sys.modules, 'lz4', None)
+    monkeypatch.setitem(sys.modules, 'lz4.frame', None)
+    papers.save(tmp_path)
+    assert (tmp_path / 'ResearchPapers.pickle').exists()
+    assert not (tmp_path / 'ResearchPapers.pickle.lz4').exists()
+    _assert_same_papers(ResearchPapers.from_pickle(tmp_path), papers)
+
+
+def test_save_removes_stale_index_tokens_file(tmp_path):
+    papers = _indexed_papers()
+    (tmp_path / 'ResearchPapersTokens.pq').touch()
+    papers.save(tmp_path)
+    assert not (tmp_path / 'ResearchPapersTokens.pq').exists()
+    unindexed = ResearchPapers(papers.metadata.drop(columns=['index_tokens']), bm25_index=papers.bm25)
+    unindexed.save(tmp_path)
+    assert 'index_tokens' not in ResearchPapers.from_pickle(tmp_path).metadata
+
+
+def test_loaded_index_tokens_share_strings(tmp_path):
+    metadata = _metadata()
+    metadata['index_tokens'] = [['remdesivir', 'covid-19'], ['bats', 'covid-19'], ['covid-19']]
+    ResearchPapers(metadata).save(tmp_path)
+    index_tokens = ResearchPapers.from_pickle(tmp_path).metadata.index_tokens
+    assert index_tokens.tolist() == metadata.index_tokens.tolist()
+    assert len({id(doc_tokens[-1]) for doc_tokens in index_tokens}) == 1
+
+
+def test_load_earlier_save(tmp_path):
+    papers = _indexed_papers()
+    with (tmp_path / 'ResearchPapers.pickle').open('wb') as f:
+        pickle.dump(papers, f)
+    _assert_same_papers(ResearchPapers.from_pickle(tmp_path), papers)
+
+
+def test_load_falls_back_to_pickle_without_lz4(tmp_path, monkeypatch):
+    papers = _indexed_papers()
+    papers.save(tmp_path)
+    with (tmp_path / 'ResearchPapers.pickle').open('wb') as f:
+        pickle.dump(papers, f)
+    monkeypatch.setitem(sys.modules, 'lz4', None)
+    monkeypatch.setitem(sys.modules, 'lz4.frame', None)
+    _assert_same_papers(ResearchPapers.from_pickle(tmp_path), papers)
+
+    (tmp_path / 'ResearchPapers.pickle').unlink()
+    with pytest.raises(ImportError):
+        ResearchPapers.from_pickle(tmp_path)
+
+
+def test_search_scores_are_float64():
+    results = _indexed_papers().search('remdesivir').results
+    assert results.Score.dtype == np.float64
+    assert results.cord_uid.iloc[0] == 'u1'
+    assert results.Score.iloc[0] == round(float(results.Score.iloc[0]), 1)
+
+
+def test_get_paper_by_position_and_cord_uid():
+    papers = _indexed_papers()
+    for paper in [papers[1], papers['u2']]:
+        assert isinstance(paper, Paper)
+        assert paper.cord_uid == 'u2'
+        assert paper.sha == 'b2'
+        assert paper.title == 'Coronavirus in bats'
+        assert not paper.has_text()
+    assert papers[0].pmcid == 'PMC1'
+    assert papers['u3'].pdf_json_files.startswith('document_parses/pdf_json/c3.json')
+
+
+def test_paper_metadata():
+    papers = _indexed_papers()
+    paper = papers['u3']
+    pd.testing.assert_series_equal(paper.metadata, papers.metadata.iloc[2])
+    assert paper.metadata is paper.metadata
+
+
+def test_paper_from_row():
+    papers = _indexed_papers()
+    row = papers.metadata.iloc[0]
+    paper = Paper(row, papers.data_path)
+    assert paper.cord_uid == 'u1'
+    assert paper.abstract == row.abstract
+    assert paper.has_text()
+    assert paper.metadata is row
+    assert paper.get_pdf_json_path() == papers.data_path / 'document_parses/pdf_json/a1.json'
+
+
+def test_paper_urls():
+    papers = _indexed_papers()
+    assert papers[0].url == 'https://doi.org/10.1016/a1'
+    assert papers[0].api_url == 'https://api.elsevier.com/content/a1'
+    assert papers[1].url is None
+    assert papers[1].api_url is None
+    assert papers[2].url == 'https://www.ncbi.nlm.nih.gov/pmc/articles/PMC3'
+    assert papers[2].api_url is None
+
+
+def test_get_search_result_by_label():
+    papers = _indexed_papers()
+    papers.metadata.index = [100, 101, 102]
+    results = papers.search('remdesivir')
+    paper = results[100]
+    assert paper.cord_uid == 'u1'
+    assert paper.url == 'http://doi.org/10.1016/a1'
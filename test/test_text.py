@@ -0,0 +1,59 @@
+import nltk
+import pytest
+from cord import text
+from cord.text import clean, filter_tokens, preprocess, preprocess_batch, preprocess_parallel
+
+TEXTS = ['The SARS-CoV-2 virus (COVID-19) was first reported in Wuhan, China in 2019.',
+         'Remdesivir/chloroquine [and] {hydroxychloroquine} were "tested" on 100 patients!',
+         "ACE2 receptor's role: binding = entry + replication & shedding | transmission*",
+         'Multi-line\nabstract\twith   extra   whitespace; and... punctuation?',
+         'Remdesivir—an antiviral—was given in 2019–2020 to ace2-dependent--and other patients',
+         'Contact @who or #covid19 for the $100 ‘remdesivir’ «trial» results',
+         '',
+         None]
+
+# Characters that nltk.word_tokenize splits words on
+NLTK_SEPARATORS = ['—', '–', '--', '@', '#', '$', '‘', '«', '»', '/', '[', ']', '{', '}', '!', '"', '*', '&']
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_preprocess_batch_matches_preprocess(text):
+    assert preprocess_batch([text]) == [preprocess(text or '')]
+
+
+def test_preprocess_parallel_matches_preprocess():
+    texts = TEXTS * 3
+    assert preprocess_parallel(texts, chunk_size=4, max_workers=2) == [preprocess(t or '') for t in texts]
+
+
+def _nltk_preprocess(text):
+    # preserve_line skips the sentence split, which only separates the periods that clean removes
+    return filter_tokens(nltk.word_tokenize(clean(text), preserve_line=True))
+
+
+@pytest.mark.parametrize('separator', NLTK_SEPARATORS)
+def test_preprocess_splits_like_nltk(separator):
+    for text in [f'remdesivir{separator}antiviral', f'covid {separator}remdesivir', f'remdesivir{separator} covid',
+                 f'2019{separator}2020', f'ace2-dependent{separator}{separator}infection']:
+        assert preprocess(text) == _nltk_preprocess(text)
+        assert preprocess_batch([text]) == [_nltk_preprocess(text)]
+
+
+def test_preprocess_keeps_words_next_to_dashes():
+    assert preprocess('remdesivir—an antiviral') == ['remdesivir', 'antiviral']
+    assert preprocess('2019–2020') == ['2019', '2020']
+    assert preprocess('ace2-dependent--and') == ['ace2-dependent']
+
+
+def test_preprocess_parallel_with_one_worker_runs_in_process(monkeypatch):
+    def no_pool(*args):
+        raise AssertionError('A Pool was started for one worker')
+
+    monkeypatch.setattr(text, 'Pool', no_pool)
+    texts = TEXTS * 3
+    assert preprocess_parallel(texts, chunk_size=4, max_workers=1) == [preprocess(t or '') for t in texts]
+
+
+def test_preprocess_parallel_shares_token_strings():
+    tokens = preprocess_parallel(['remdesivir trial ' + str(i) for i in range(10)], chunk_size=3, max_workers=2)
+    assert len({id(doc_tokens[0]) for doc_tokens in tokens}) == 1